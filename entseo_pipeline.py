@@ -1,9 +1,23 @@
 import os
-import requests
-import xml.etree.ElementTree as ET
+import asyncio
+import queue
+import threading
+import aiohttp
+from urllib.parse import urlencode
+from yarl import URL
+from collections import Counter, defaultdict
+from itertools import groupby
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
+from lxml import etree as ET
 from datetime import datetime, timedelta, UTC
 from pymongo import MongoClient, UpdateOne
+from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
+from diskcache import Cache
+import calendar
 import logging
 import time
 
@@ -13,6 +27,58 @@ API_KEY = os.getenv("API_KEY")
 MONGO_URI = "mongodb://localhost:27017"
 DB_NAME = "entsoe_db"
 COLLECTION_NAME = "entsoe_test_bis"
+API_URL = "https://web-api.tp.entsoe.eu/api"
+CACHE_DIR = "cache/entsoe"
+CACHE_VERSION = 1  # bump whenever parsing or timestamp formatting changes what a window yields
+CACHE_TTL = 7 * 24 * 3600  # seconds; ENTSO-E revises published actuals after the fact
+
+# === Concurrency ===
+MAX_IN_FLIGHT = 16  # concurrent requests allowed against the ENTSO-E API
+# Every request goes to one host. With a connection per request slot, a slot holder never queues
+# inside the connector after reserving its start time in wait_for_slot.
+HTTP_CONNECTIONS = MAX_IN_FLIGHT
+HTTP_CONNECTIONS_PER_HOST = MAX_IN_FLIGHT
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REQUESTS_PER_MINUTE = 400  # ENTSO-E API limit per security token
+REQUEST_SPACING = 60 / REQUESTS_PER_MINUTE
+BULK_CHUNK_SIZE = 1000
+BULK_WORKERS = 4
+FLUSH_SIZE = BULK_CHUNK_SIZE * BULK_WORKERS  # flush a zone early once every bulk worker has a full chunk
+
+# === Bidding zones ===
+BIDDING_ZONES = {
+    "AT": "10YAT-APG------L",
+    "BE": "10YBE----------2",
+    "CZ": "10YCZ-CEPS-----N",
+    "DK1": "10YDK-1--------W",
+    "DK2": "10YDK-2--------M",
+    "EE": "10Y1001A1001A39I",
+    "GR": "10YGR-HTSO-----Y",
+    "FI": "10YFI-1--------U",
+    "HU": "10YHU-MAVIR----U",
+    "IE (SEM)": "10Y1001A1001A59C",
+    "IT-CENTRE_NORTH": "10Y1001A1001A70O",
+    "IT-CENTRE_SOUTH": "10Y1001A1001A71M",
+    "IT-North": "10Y1001A1001A73I",
+    "IT-SACOAC": "10Y1001A1001A885",
+    "IT-SACODC": "10Y1001A1001A893",
+    "IT-Sardinia": "10Y1001A1001A74G",
+    "IT-Sicily": "10Y1001A1001A75E",
+    "IT-South": "10Y1001A1001A788",
+    "LT": "10YLT-1001A0008Q",
+    "LV": "10YLV-1001A00074",
+    "NL": "10YNL----------L",
+    "PL": "10YPL-AREA-----S",
+    "PT": "10YPT-REN------W",
+    "RO": "10YRO-TEL------P",
+    "SE1": "10Y1001A1001A44P",
+    "SE2": "10Y1001A1001A45N",
+    "SE3": "10Y1001A1001A46L",
+    "SE4": "10Y1001A1001A47J",
+    "SI": "10YSI-ELES-----O",
+    "SK": "10YSK-SEPS-----K"
+}
 
 # === Logging setup ===
 os.makedirs("logs", exist_ok=True)
@@ -29,164 +95,474 @@ logging.basicConfig(
 NS_GEN = {'ns': 'urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0'}
 NS_PRICE = {'ns': 'urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:3'}
 
+# Clark-notation tags matched by the streaming parser
+GEN_PERIOD = f"{{{NS_GEN['ns']}}}Period"
+PRICE_PERIOD = f"{{{NS_PRICE['ns']}}}Period"
+PRICE_TIMESERIES = f"{{{NS_PRICE['ns']}}}TimeSeries"
+PRICE_CONTRACT_TYPE = f"{{{NS_PRICE['ns']}}}contract_MarketAgreement.type"
+
+# === Compiled XPath queries ===
+XP_GEN_RESOLUTION = ET.XPath("ns:resolution/text()", namespaces=NS_GEN, smart_strings=False)
+XP_GEN_START = ET.XPath("ns:timeInterval/ns:start/text()", namespaces=NS_GEN, smart_strings=False)
+XP_GEN_POSITIONS = ET.XPath("ns:Point[ns:quantity]/ns:position/text()", namespaces=NS_GEN, smart_strings=False)
+XP_GEN_QUANTITIES = ET.XPath("ns:Point[ns:position]/ns:quantity/text()", namespaces=NS_GEN, smart_strings=False)
+XP_PRICE_RESOLUTION = ET.XPath("ns:resolution/text()", namespaces=NS_PRICE, smart_strings=False)
+XP_PRICE_START = ET.XPath("ns:timeInterval/ns:start/text()", namespaces=NS_PRICE, smart_strings=False)
+XP_PRICE_POSITIONS = ET.XPath("ns:Point[ns:price.amount]/ns:position/text()", namespaces=NS_PRICE, smart_strings=False)
+XP_PRICE_AMOUNTS = ET.XPath("ns:Point[ns:position]/ns:price.amount/text()", namespaces=NS_PRICE, smart_strings=False)
+
+RESOLUTION_MINUTES = {"PT15M": 15, "PT60M": 60}
+
+# === Streaming helpers ===
+def release(elem):
+    """Free a streamed element together with the siblings parsed before it."""
+    elem.clear()
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+
+async def stream_events(response, tag):
+    """Yield parser end events for `tag` while the response body is still arriving."""
+    parser = ET.XMLPullParser(events=("end",), tag=tag)
+    async for chunk in response.content.iter_any():
+        parser.feed(chunk)
+        for event in parser.read_events():
+            yield event
+    parser.close()
+    for event in parser.read_events():
+        yield event
+
+
+# === Numeric helpers ===
+def int_array(texts):
+    """Int64 array from XPath text() results, parsed in one C call over the joined strings."""
+    values = np.fromstring(" ".join(texts), dtype=np.int64, sep=" ")
+    # NumPy 1.x stops at malformed text with only a warning; a short array would misalign with the values.
+    if len(values) != len(texts):
+        raise ValueError(f"Malformed integer text in {texts[:5]}...")
+    return values
+
+
+def check_paired(positions, values):
+    """Reject a Period whose position and value lists differ, e.g. a Point with an empty child."""
+    if len(positions) != len(values):
+        raise ValueError(f"Period has {len(positions)} positions but {len(values)} values")
+
+
+def float_array(texts):
+    """Float64 array from XPath text() results."""
+    return np.asarray(texts, dtype=np.float64)
+
+
+# === Timestamp helpers ===
+def epoch_seconds(iso):
+    """Unix seconds of an ENTSO-E interval bound such as 2025-03-31T22:00Z."""
+    return calendar.timegm(datetime.fromisoformat(iso).utctimetuple())
+
+
+def point_timestamps(base_ts, positions, interval):
+    """ISO timestamps of 1-based point positions in a period of `interval` minutes."""
+    offsets = (positions - 1) * (interval * 60)
+    return np.datetime_as_string(np.datetime64(base_ts, "s") + offsets, unit="s", timezone="UTC")
+
+
+def next_month(current):
+    return (current + timedelta(days=32)).replace(day=1)
+
+
+def next_day(current):
+    return current + timedelta(days=1)
+
+
+# === Mongo helpers ===
+def merge_by_timestamp(field, points):
+    """Pipeline expression folding `points` into the stored `field` array, matched on timestamp.
+
+    The result is kept sorted by timestamp, which needs $sortArray (MongoDB 5.2+).
+    """
+    stored = {"$ifNull": [f"${field}", []]}
+    merged = {"$concatArrays": [
+        {"$filter": {
+            "input": stored,
+            "cond": {"$not": [{"$in": ["$$this.timestamp", {"$literal": [p["timestamp"] for p in points]}]}]}
+        }},
+        {"$map": {
+            "input": {"$literal": points},
+            "as": "point",
+            "in": {"$mergeObjects": [
+                {"$ifNull": [{"$arrayElemAt": [
+                    {"$filter": {"input": stored, "cond": {"$eq": ["$$this.timestamp", "$$point.timestamp"]}}}, 0
+                ]}, {}]},
+                "$$point"
+            ]}
+        }}
+    ]}
+    return {"$sortArray": {"input": merged, "sortBy": {"timestamp": 1}}}
+
+
+# === Storage strategies ===
+# flat: one document per (bidding_zone, timestamp), 15-minute points only, fetched in month windows.
+# daily_embedded: one document per (bidding_zone, date) holding PT15M/PT60M point arrays, fetched per day.
+STORAGE_STRATEGIES = {
+    "flat": {
+        "history_start": datetime(2025, 4, 1, tzinfo=UTC),
+        "next_window": next_month,
+        "resolutions": {"PT15M"},
+        "drop_zero_prices": False,
+        "writer": "write_records",
+        "unique_index": [("bidding_zone", 1), ("timestamp", 1)]
+    },
+    "daily_embedded": {
+        "history_start": datetime(2025, 6, 1, tzinfo=UTC),
+        "next_window": next_day,
+        "resolutions": {"PT15M", "PT60M"},
+        "drop_zero_prices": True,
+        "writer": "write_days",
+        "unique_index": None  # documents are keyed by _id {bidding_zone, date}
+    }
+}
+
 
 class EntsoePipeline:
-    def __init__(self, api_key, mongo_uri, db_name, collection_name):
+    def __init__(self, api_key, mongo_uri, db_name, collection_name, storage_strategy="flat"):
+        if storage_strategy not in STORAGE_STRATEGIES:
+            raise ValueError(f"Unknown storage strategy: {storage_strategy}")
         self.api_key = api_key
+        self.strategy = STORAGE_STRATEGIES[storage_strategy]
+        self.write = getattr(self, self.strategy["writer"])
         self.client = MongoClient(mongo_uri)
         self.collection = self.client[db_name][collection_name]
+        if self.strategy["unique_index"]:
+            self.collection.create_index(self.strategy["unique_index"], unique=True)
+        # Both are bound to the event loop, so fetch_windows creates them per run.
+        self.session = None
+        self.request_slots = None
+        self.next_slot = time.monotonic()
+        self.url_templates = {}
+        self.write_error = None
+        # Parsed series depend on the parser version and the strategy's resolutions and zero-price filter
+        self.cache = Cache(os.path.join(CACHE_DIR, f"v{CACHE_VERSION}", storage_strategy))
+        # Only windows ending before today's UTC midnight are final: actual generation for the last
+        # hours of yesterday is often published after 00:00, so yesterday's window is not cached yet.
+        self.cache_horizon = datetime.now(UTC).strftime("%Y%m%d0000")
 
-    def get_existing_fields_by_timestamp(self, bidding_zone):
-        cursor = self.collection.find(
-            {"bidding_zone": bidding_zone},
-            {"timestamp": 1, "A75_A16_B16": 1, "A44_A01": 1, "A44_A07": 1}
-        )
-        mapping = {}
-        for doc in cursor:
-            ts = doc["timestamp"]
-            keys = {k for k in ["A75_A16_B16", "A44_A01", "A44_A07"] if k in doc}
-            mapping[ts] = keys
-        return mapping
-
-    def fetch_generation(self, eic, start, end):
-        params = {
-            "securityToken": self.api_key,
-            "documentType": "A75",
-            "processType": "A16",
-            "in_Domain": eic,
-            "periodStart": start,
-            "periodEnd": end,
-            "psrType": "B16"
-        }
-        r = requests.get("https://web-api.tp.entsoe.eu/api", params=params)
-        if r.status_code != 200:
-            logging.warning(f"[GEN] HTTP {r.status_code}: {r.text[:300]}")
-            return []
+    async def wait_for_slot(self):
+        """Space request starts REQUEST_SPACING apart across every task on the loop."""
+        now = time.monotonic()
+        slot = max(self.next_slot, now)
+        self.next_slot = slot + REQUEST_SPACING
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def url_templates_for(self, eic):
+        """Pre-encoded query URLs for `eic`, leaving only {start} and {end} to fill in."""
+        if eic not in self.url_templates:
+            gen = urlencode({
+                "securityToken": self.api_key,
+                "documentType": "A75",
+                "processType": "A16",
+                "in_Domain": eic,
+                "psrType": "B16"
+            })
+            price = urlencode({
+                "securityToken": self.api_key,
+                "documentType": "A44",
+                "in_Domain": eic,
+                "out_Domain": eic
+            })
+            period = "&periodStart={start}&periodEnd={end}"
+            self.url_templates[eic] = {"GEN": f"{API_URL}?{gen}{period}", "PRICE": f"{API_URL}?{price}{period}"}
+        return self.url_templates[eic]
+
+    def cached(self, key):
+        """Series parsed for a closed (doc_type, eic, start, end) window on an earlier run, or None."""
+        return self.cache.get(key) if key[-1] < self.cache_horizon else None
+
+    def remember(self, key, series):
+        # Empty results may come from a failed request or a late publication, so they are fetched again.
+        if key[-1] < self.cache_horizon and any(stamps for stamps, *_ in series.values()):
+            self.cache.set(key, series, expire=CACHE_TTL)
+
+    async def get_document(self, kind, url, parse):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with self.request_slots:
+                    # Reserve the start time only once a slot is held, so requests queued behind the
+                    # semaphore cannot bank expired reservations and start in a burst later.
+                    await self.wait_for_slot()
+                    async with self.session.get(URL(url, encoded=True)) as r:
+                        if r.status == 200:
+                            return await parse(r)
+                        if r.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                            logging.warning(f"[{kind}] HTTP {r.status}: {(await r.text())[:300]}")
+                            return None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == MAX_RETRIES:
+                    raise
+            await asyncio.sleep(2 ** attempt)
+
+    async def fetch_generation(self, eic, start, end):
+        key = ("A75", eic, start, end)
+        series = self.cached(key)
+        if series is not None:
+            return series
+        url = self.url_templates_for(eic)["GEN"].format(start=start, end=end)
         try:
-            root = ET.fromstring(r.content)
-        except ET.ParseError as e:
+            series = await self.get_document("GEN", url, self.parse_generation)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"[GEN] Request error for {eic}: {e}")
+            series = None
+        if series:
+            self.remember(key, series)
+        return series or {"A75_A16_B16": ([], [], [])}
+
+    async def parse_generation(self, response):
+        stamps, values, resolutions = [], [], []
+        try:
+            async for _, period in stream_events(response, GEN_PERIOD):
+                resolution = XP_GEN_RESOLUTION(period)[0]
+                if resolution not in self.strategy["resolutions"]:
+                    logging.warning(f"[GEN] Skipping {resolution} resolution")
+                    release(period)
+                    continue
+                start = XP_GEN_START(period)[0]
+                positions = XP_GEN_POSITIONS(period)
+                quantities = XP_GEN_QUANTITIES(period)
+                release(period)
+                check_paired(positions, quantities)
+
+                period_stamps = point_timestamps(
+                    epoch_seconds(start), int_array(positions), RESOLUTION_MINUTES[resolution]
+                )
+                stamps.extend(period_stamps.tolist())
+                values.extend(float_array(quantities).tolist())
+                resolutions.extend([resolution] * len(period_stamps))
+        except (ET.ParseError, ValueError) as e:
             logging.warning(f"[GEN] XML parse error: {e}")
-            return []
+            return {"A75_A16_B16": ([], [], [])}
+        return {"A75_A16_B16": (stamps, values, resolutions)}
 
-        results = []
-        for ts in root.findall(".//ns:TimeSeries", NS_GEN):
-            period = ts.find("ns:Period", NS_GEN)
-            if period is None:
-                continue
-            start_time = datetime.fromisoformat(period.find("ns:timeInterval/ns:start", NS_GEN).text)
-            resolution = period.find("ns:resolution", NS_GEN).text
-            if resolution != "PT15M":
-                logging.warning(f"[GEN] Skipping non-15min resolution: {resolution}")
-                continue
-            interval = 15
-            for point in period.findall("ns:Point", NS_GEN):
-                pos = int(point.find("ns:position", NS_GEN).text)
-                qty = float(point.find("ns:quantity", NS_GEN).text)
-                ts = (start_time + timedelta(minutes=(pos - 1) * interval)).isoformat() + "Z"
-                results.append((ts, qty))
+    async def fetch_prices(self, eic, start, end):
+        key = ("A44", eic, start, end)
+        series = self.cached(key)
+        if series is not None:
+            return series
+        url = self.url_templates_for(eic)["PRICE"].format(start=start, end=end)
+        try:
+            series = await self.get_document("PRICE", url, self.parse_prices)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"[PRICE] Request error for {eic}: {e}")
+            series = None
+        if series:
+            self.remember(key, series)
+        return series or {"A44_A01": ([], [], []), "A44_A07": ([], [], [])}
+
+    async def parse_prices(self, response):
+        results = {"A44_A01": ([], [], []), "A44_A07": ([], [], [])}
+        label = None
+        try:
+            async for _, elem in stream_events(response, (PRICE_CONTRACT_TYPE, PRICE_PERIOD, PRICE_TIMESERIES)):
+                if elem.tag == PRICE_PERIOD and label is not None:
+                    resolution = XP_PRICE_RESOLUTION(elem)[0]
+                    if resolution not in self.strategy["resolutions"]:
+                        logging.warning(f"[PRICE] Skipping {resolution} resolution")
+                    else:
+                        start = XP_PRICE_START(elem)[0]
+                        positions = XP_PRICE_POSITIONS(elem)
+                        amounts = XP_PRICE_AMOUNTS(elem)
+                        check_paired(positions, amounts)
+                        period_positions = int_array(positions)
+                        period_values = float_array(amounts) / 10
+                        if self.strategy["drop_zero_prices"]:
+                            keep = period_values != 0.0
+                            period_positions, period_values = period_positions[keep], period_values[keep]
+
+                        period_stamps = point_timestamps(
+                            epoch_seconds(start), period_positions, RESOLUTION_MINUTES[resolution]
+                        )
+                        stamps, values, resolutions = results[label]
+                        stamps.extend(period_stamps.tolist())
+                        values.extend(period_values.tolist())
+                        resolutions.extend([resolution] * len(period_stamps))
+                elif elem.tag == PRICE_CONTRACT_TYPE:
+                    label = f"A44_{elem.text}"
+                    results.setdefault(label, ([], [], []))
+                elif elem.tag == PRICE_TIMESERIES:
+                    label = None
+                release(elem)
+        except (ET.ParseError, ValueError) as e:
+            logging.warning(f"[PRICE] XML parse error: {e}")
+            return {"A44_A01": ([], [], []), "A44_A07": ([], [], [])}
         return results
 
-    def fetch_prices(self, eic, start, end):
-        params = {
-            "securityToken": self.api_key,
-            "documentType": "A44",
-            "in_Domain": eic,
-            "out_Domain": eic,
-            "periodStart": start,
-            "periodEnd": end
+    def merge_series(self, series):
+        points = sorted(
+            ((res, ts, label, val)
+             for label, (stamps, values, resolutions) in series.items()
+             for ts, val, res in zip(stamps, values, resolutions)),
+            key=itemgetter(0, 1)
+        )
+        return {
+            res: [
+                {"timestamp": ts, **{label: val for _, _, label, val in point_group}}
+                for ts, point_group in groupby(res_points, key=itemgetter(1))
+            ]
+            for res, res_points in groupby(points, key=itemgetter(0))
         }
-        r = requests.get("https://web-api.tp.entsoe.eu/api", params=params)
-        if r.status_code != 200:
-            logging.warning(f"[PRICE] HTTP {r.status_code}: {r.text[:300]}")
-            return {"A44_A01": [], "A44_A07": []}
+
+    def bulk_upsert(self, ops):
+        write = partial(self.collection.bulk_write, ordered=False, bypass_document_validation=True)
+        chunks = [ops[i:i + BULK_CHUNK_SIZE] for i in range(0, len(ops), BULK_CHUNK_SIZE)]
+        if len(chunks) == 1:
+            write(chunks[0])
+            return
+        with ThreadPoolExecutor(max_workers=BULK_WORKERS) as executor:
+            list(executor.map(write, chunks))
+
+    def flush_zone(self, zone, ops):
         try:
-            root = ET.fromstring(r.content)
-        except ET.ParseError as e:
-            logging.warning(f"[PRICE] XML parse error: {e}")
-            return {"A44_A01": [], "A44_A07": []}
+            self.bulk_upsert(ops)
+        except PyMongoError as e:
+            logging.error(f"{zone}: Write failed: {e}")
+            raise
+        print(f"✅ Inserted/Updated {len(ops)} records for {zone}")
+        logging.info(f"{zone}: Inserted {len(ops)} records")
 
-        results = {"A44_A01": [], "A44_A07": []}
-        for ts in root.findall(".//ns:TimeSeries", NS_PRICE):
-            ctype = ts.find("ns:contract_MarketAgreement.type", NS_PRICE)
-            if ctype is None:
-                continue
-            label = f"A44_{ctype.text}"
-            if label not in results:
-                results[label] = []
+    def write_records(self, writes):
+        zone_ops = defaultdict(list)
+        while True:
+            item = writes.get()
+            if item is None:
+                break
+            zone, _, series, zone_done = item
+            stamps = sorted(set().union(*(ts_list for ts_list, *_ in series.values())))
+            if not stamps:
+                print("ℹ️ No new data for this month")
+                logging.info(f"{zone}: No new data")
+            else:
+                columns = {label: dict(zip(ts_list, values)) for label, (ts_list, values, _) in series.items()}
+                zone_ops[zone].extend(
+                    UpdateOne(
+                        {"bidding_zone": zone, "timestamp": ts},
+                        [{"$set": {
+                            label: {"$ifNull": [f"${label}", column[ts]]}
+                            for label, column in columns.items() if ts in column
+                        }}],
+                        upsert=True
+                    ) for ts in stamps
+                )
 
-            period = ts.find("ns:Period", NS_PRICE)
-            if period is None:
-                continue
-            start_time = datetime.fromisoformat(
-                period.find("ns:timeInterval/ns:start", NS_PRICE).text.replace("Z", "")
-            )
-            resolution = period.find("ns:resolution", NS_PRICE).text
-            if resolution != "PT15M":
-                logging.warning(f"[PRICE] Skipping non-15min resolution: {resolution}")
+            if zone in zone_ops and (zone_done or len(zone_ops[zone]) >= FLUSH_SIZE):
+                self.flush_zone(zone, zone_ops.pop(zone))
+
+        # Zones left over when the fetch loop stopped early
+        for zone, ops in zone_ops.items():
+            self.flush_zone(zone, ops)
+
+    def flush_days(self, ops):
+        try:
+            self.bulk_upsert(ops)
+        except PyMongoError as e:
+            logging.error(f"Write failed for {len(ops)} days: {e}")
+            raise
+        print(f"✅ Stored {len(ops)} days")
+        logging.info(f"Stored {len(ops)} days")
+
+    def write_days(self, writes):
+        ops = []
+        while True:
+            item = writes.get()
+            if item is None:
+                break
+            zone, period_start, series, _ = item
+            day_str = datetime.strptime(period_start, "%Y%m%d%H%M").strftime("%Y-%m-%d")
+            merged = self.merge_series(series)
+            if not merged:
+                print("ℹ️ No new data for this day")
+                logging.info(f"{zone}: No new data")
                 continue
-            interval = 15
 
-            for point in period.findall("ns:Point", NS_PRICE):
-                pos = point.find("ns:position", NS_PRICE)
-                val = point.find("ns:price.amount", NS_PRICE)
-                if pos is None or val is None:
-                    continue
-                ts_point = (start_time + timedelta(minutes=(int(pos.text) - 1) * interval)).isoformat() + "Z"
-                results[label].append((ts_point, float(val.text) / 10))
-        return results
+            # Points already stored for the day keep the labels this run did not return
+            day_doc = {
+                "bidding_zone": zone,
+                "date": day_str,
+                **{res: merge_by_timestamp(res, points) for res, points in merged.items()}
+            }
+            ops.append(UpdateOne({"_id": {"bidding_zone": zone, "date": day_str}}, [{"$set": day_doc}], upsert=True))
+            # Days from all zones share a batch; one bulk_write per BULK_CHUNK_SIZE days
+            if len(ops) >= BULK_CHUNK_SIZE:
+                self.flush_days(ops)
+                ops = []
+
+        if ops:
+            self.flush_days(ops)
+
+    def run_writer(self, writes):
+        try:
+            self.write(writes)
+        except Exception as e:
+            # Recorded for run() to re-raise; fetch_windows stops feeding the queue once it is set
+            logging.error(f"Writer stopped: {e!r}")
+            self.write_error = e
 
     def run(self, bidding_zones):
         now = datetime.now(UTC)
-        start = datetime(2025, 4, 1, tzinfo=UTC)
-        window_size = timedelta(days=32)
+        next_window = self.strategy["next_window"]
 
+        windows = []
         for zone, eic in bidding_zones.items():
             print(f"\n🔄 Fetching data for {zone}")
             logging.info(f"Start processing {zone}")
-            current = start
-            existing = self.get_existing_fields_by_timestamp(zone)
-
+            current = self.strategy["history_start"]
             while current < now:
                 period_start = current.strftime("%Y%m%d%H%M")
-                next_month = (current + window_size).replace(day=1)
-                period_end = min(next_month, now).strftime("%Y%m%d%H%M")
-
-                print(f"🗓️  {zone}: {period_start} → {period_end}")
-                logging.info(f"{zone}: {period_start} → {period_end}")
-
-                gen_data = self.fetch_generation(eic, period_start, period_end)
-                price_data = self.fetch_prices(eic, period_start, period_end)
-
-                merged = {}
-                for ts, val in gen_data:
-                    if ts in existing and "A75_A16_B16" in existing[ts]:
-                        continue
-                    merged.setdefault(ts, {"bidding_zone": zone, "timestamp": ts})
-                    merged[ts]["A75_A16_B16"] = val
-
-                for label, series in price_data.items():
-                    for ts, val in series:
-                        if ts in existing and label in existing[ts]:
-                            continue
-                        merged.setdefault(ts, {"bidding_zone": zone, "timestamp": ts})
-                        merged[ts][label] = val
-
-                records = list(merged.values())
-                if records:
-                    self.collection.bulk_write([
-                        UpdateOne(
-                            {"bidding_zone": rec["bidding_zone"], "timestamp": rec["timestamp"]},
-                            {"$set": rec},
-                            upsert=True
-                        ) for rec in records
-                    ])
-                    print(f"✅ Inserted/Updated {len(records)} records")
-                    logging.info(f"{zone}: Inserted {len(records)} records")
-                else:
-                    print("ℹ️ No new data for this month")
-                    logging.info(f"{zone}: No new data")
-
-                current = next_month
+                window_end = next_window(current)
+                period_end = min(window_end, now).strftime("%Y%m%d%H%M")
+                windows.append((zone, eic, period_start, period_end))
+                current = window_end
+
+        writes = queue.Queue()
+        self.write_error = None
+        writer = threading.Thread(target=self.run_writer, args=(writes,))
+        writer.start()
+        try:
+            asyncio.run(self.fetch_windows(windows, writes))
+        finally:
+            writes.put(None)
+            writer.join()
+        if self.write_error is not None:
+            raise self.write_error
+
+    async def fetch_window(self, zone, eic, period_start, period_end):
+        gen_data, price_data = await asyncio.gather(
+            self.fetch_generation(eic, period_start, period_end),
+            self.fetch_prices(eic, period_start, period_end)
+        )
+        return zone, period_start, period_end, {**gen_data, **price_data}
+
+    async def fetch_windows(self, windows, writes):
+        self.request_slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+        connector = aiohttp.TCPConnector(limit=HTTP_CONNECTIONS, limit_per_host=HTTP_CONNECTIONS_PER_HOST)
+        timeout = aiohttp.ClientTimeout(sock_connect=30, sock_read=30)
+        remaining = Counter(zone for zone, *_ in windows)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as self.session:
+            tasks = [asyncio.ensure_future(self.fetch_window(*window)) for window in windows]
+            try:
+                for next_window in asyncio.as_completed(tasks):
+                    zone, period_start, period_end, series = await next_window
+                    if self.write_error is not None:
+                        break
+
+                    print(f"🗓️  {zone}: {period_start} → {period_end}")
+                    logging.info(f"{zone}: {period_start} → {period_end}")
+
+                    remaining[zone] -= 1
+                    writes.put((zone, period_start, series, not remaining[zone]))
+            finally:
+                # Windows still in flight when the loop stops early must not outlive the session
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
 
 
 if __name__ == "__main__":
@@ -199,12 +575,7 @@ if __name__ == "__main__":
         collection_name=COLLECTION_NAME
     )
 
-    bidding_zones = {
-        "AT": "10YAT-APG------L",
-        "BE": "10YBE----------2"
-    }
-
-    pipeline.run(bidding_zones)
+    pipeline.run({zone: BIDDING_ZONES[zone] for zone in ("AT", "BE")})
 
     duration = time.time() - start_time
     mins, secs = divmod(duration, 60)
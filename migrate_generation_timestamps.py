@@ -0,0 +1,77 @@
+"""One-off cleanup of generation points stored with the old "+00:00Z" timestamps.
+
+Generation timestamps used to be written as 2025-04-01T00:00:00+00:00Z while prices used
+2025-04-01T00:00:00Z, so one instant ended up as two points. The pipelines now write the "Z" form
+only; run this once against existing data to fold the old points into the new ones.
+"""
+from pymongo import MongoClient, UpdateOne, DeleteOne
+from operator import itemgetter
+import logging
+
+import entseo_pipeline
+import entseo_pipeline_time_serie
+from entseo_pipeline import MONGO_URI, DB_NAME, BULK_CHUNK_SIZE
+
+LEGACY_SUFFIX = "+00:00Z"
+LEGACY_PATTERN = r"\+00:00Z$"
+
+
+def normalise(ts):
+    return ts[:-len(LEGACY_SUFFIX)] + "Z" if ts.endswith(LEGACY_SUFFIX) else ts
+
+
+def write_chunks(collection, ops):
+    # Ordered, so a legacy document is only deleted after the upsert carrying its fields succeeded;
+    # the first failure raises and stops every later op, including the following chunks.
+    for i in range(0, len(ops), BULK_CHUNK_SIZE):
+        collection.bulk_write(ops[i:i + BULK_CHUNK_SIZE], ordered=True)
+
+
+def migrate_flat(collection):
+    """Move fields of legacy (bidding_zone, timestamp) documents onto the normalised timestamp."""
+    ops = []
+    for doc in collection.find({"timestamp": {"$regex": LEGACY_PATTERN}}):
+        fields = {k: v for k, v in doc.items() if k not in ("_id", "bidding_zone", "timestamp")}
+        if fields:
+            ops.append(UpdateOne(
+                {"bidding_zone": doc["bidding_zone"], "timestamp": normalise(doc["timestamp"])},
+                [{"$set": {label: {"$ifNull": [f"${label}", {"$literal": value}]} for label, value in fields.items()}}],
+                upsert=True
+            ))
+        ops.append(DeleteOne({"_id": doc["_id"]}))
+    write_chunks(collection, ops)
+    return sum(isinstance(op, DeleteOne) for op in ops)
+
+
+def migrate_daily(collection):
+    """Merge legacy points inside the PT15M/PT60M arrays of each day document into the normalised ones."""
+    resolutions = ("PT15M", "PT60M")
+    query = {"$or": [{f"{res}.timestamp": {"$regex": LEGACY_PATTERN}} for res in resolutions]}
+    ops = []
+    for doc in collection.find(query, {res: 1 for res in resolutions}):
+        update = {}
+        for res in resolutions:
+            if res not in doc:
+                continue
+            points = {}
+            for point in doc[res]:
+                ts = normalise(point["timestamp"])
+                points.setdefault(ts, {"timestamp": ts}).update(
+                    {label: value for label, value in point.items() if label != "timestamp"}
+                )
+            update[res] = sorted(points.values(), key=itemgetter("timestamp"))
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+    write_chunks(collection, ops)
+    return len(ops)
+
+
+if __name__ == "__main__":
+    db = MongoClient(MONGO_URI)[DB_NAME]
+
+    flat_count = migrate_flat(db[entseo_pipeline.COLLECTION_NAME])
+    print(f"✅ Folded {flat_count} legacy documents in {entseo_pipeline.COLLECTION_NAME}")
+    logging.info(f"Folded {flat_count} legacy documents in {entseo_pipeline.COLLECTION_NAME}")
+
+    daily_count = migrate_daily(db[entseo_pipeline_time_serie.COLLECTION_NAME])
+    print(f"✅ Rewrote {daily_count} day documents in {entseo_pipeline_time_serie.COLLECTION_NAME}")
+    logging.info(f"Rewrote {daily_count} day documents in {entseo_pipeline_time_serie.COLLECTION_NAME}")